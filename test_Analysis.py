@@ -2,6 +2,8 @@ import Analysis
 import pandas
 import matplotlib.pyplot as plt
 import os
+import json
+import pytest
 from pytest import raises
 
 #assert that Analysis initializer correctly parses configs if config files are present
@@ -21,7 +23,7 @@ def testAnalysisInitializerRaises():
 def testAnalysisLoadData():
     analysis = Analysis.Analysis('configs/job_file.yml')
     analysis.load_data()
-    assert hasattr(analysis, 'dataset')
+    assert analysis.dataset is not None
 
 #assert that Analysis load_data function can fetch and parse GitHub API data
 def testAnalysisComputeAnalysis():
@@ -37,4 +39,80 @@ def testAnalysisPlotData():
     analysis.load_data()
     figure = analysis.plot_data()
     assert type(figure) == plt.Figure
-    assert os.path.isfile('output_figures/engagement_scatter_plots.png')
\ No newline at end of file
+    assert os.path.isfile('output_figures/engagement_scatter_plots.png')
+
+# assert that plot_data rasterizes large orgs with datashader, including when all values are equal
+def testAnalysisPlotDataLargeOrg(tmp_path):
+    pytest.importorskip('datashader')
+    analysis = Analysis.Analysis('configs/job_file.yml')
+    n = Analysis._DATASHADER_THRESHOLD + 1
+    analysis.dataset = pandas.DataFrame({'forks_count': [3] * n, 'open_issues_count': [3] * n, 'watchers_count': [7] * n})
+    figure = analysis.plot_data(save_path=str(tmp_path / 'large_org.png'))
+    assert type(figure) == plt.Figure
+    assert os.path.isfile(tmp_path / 'large_org.png')
+
+
+# minimal stand in for requests.Session, returns canned GitHub API payloads and counts calls
+class FakeSession():
+    def __init__(self, payloads):
+        self.payloads = list(payloads)
+        self.calls = 0
+
+    def get(self, url, **kwargs):
+        self.calls += 1
+        response = type('FakeResponse', (), {})()
+        response.content = json.dumps(self.payloads.pop(0)).encode('utf-8')
+        return response
+
+
+def repos(forks, issues, watchers):
+    return [{'forks_count': forks, 'open_issues_count': issues, 'watchers_count': watchers}]
+
+
+# assert that a config cache hit returns the same dict as parsing the yml
+def testConfigCacheHit(tmp_path):
+    path = str(tmp_path / 'config.yml')
+    with open(path, 'w') as f:
+        f.write('owner: pytest-dev\nfigure_size_x: 8\n')
+    parsed = Analysis._load_config_cached(path)
+    assert os.path.isfile(path + '.cache.json')
+    assert Analysis._load_config_cached(path) == parsed == {'owner': 'pytest-dev', 'figure_size_x': 8}
+
+
+# assert that the config cache is rewritten when the yml is modified after it
+def testConfigCacheRewrittenWhenYmlChanges(tmp_path):
+    path = str(tmp_path / 'config.yml')
+    with open(path, 'w') as f:
+        f.write('owner: pytest-dev\n')
+    Analysis._load_config_cached(path)
+    with open(path, 'w') as f:
+        f.write('owner: numpy\n')
+    cache_mtime = os.path.getmtime(path + '.cache.json')
+    os.utime(path, (cache_mtime + 10, cache_mtime + 10))
+    assert Analysis._load_config_cached(path) == {'owner': 'numpy'}
+    with open(path + '.cache.json') as f:
+        assert json.load(f) == {'owner': 'numpy'}
+
+
+# assert that compute_analysis recomputes after load_data refreshes the dataset
+def testAnalysisComputeAnalysisAfterReload():
+    analysis = Analysis.Analysis('configs/job_file.yml')
+    analysis._session = FakeSession([repos(1, 2, 3), repos(4, 5, 6)])
+    analysis.load_data()
+    assert list(analysis.compute_analysis()) == [1, 2, 3]
+    analysis.load_data()
+    assert list(analysis.compute_analysis()) == [4, 5, 6]
+
+
+# assert that load_data uses the prefetched response exactly once
+def testAnalysisLoadDataUsesPrefetchOnce(monkeypatch):
+    prefetch_session = FakeSession([repos(1, 2, 3)])
+    monkeypatch.setattr(Analysis, '_PREFETCH_SESSION', prefetch_session)
+    analysis = Analysis.Analysis('configs/job_file.yml', prefetch=True)
+    analysis._session = FakeSession([repos(4, 5, 6)])
+    analysis.load_data()
+    assert list(analysis.compute_analysis()) == [1, 2, 3]
+    analysis.load_data()
+    assert list(analysis.compute_analysis()) == [4, 5, 6]
+    assert prefetch_session.calls == 1
+    assert analysis._session.calls == 1